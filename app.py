@@ -3,10 +3,20 @@ import pandas as pd
 import numpy as np
 import datetime
 import os
+import sys
+import threading
+import time
+import uuid
+import weakref
 import matplotlib.pyplot as plt
 from sklearn.linear_model import LinearRegression
 from sklearn.preprocessing import StandardScaler
 
+from insights import METRIC_COLUMNS, METRIC_LABELS, data_version, describe_correlation, find_lagged_correlations
+from symptoms import METRIC_OPERATORS, SymptomIndex, query_symptom_days, symptom_metric_associations
+from ingest import (COLUMNS, MANUAL_SOURCE, load_user_data, merge_user_entries, user_lock,
+                    valid_username, write_user_data)
+
 # Set page configuration
 st.set_page_config(
     page_title="Project Synapse Core",
@@ -28,6 +38,11 @@ def configure_plot_for_dark_theme(fig, ax):
         spine.set_edgecolor('white')
     return fig, ax
 
+def render_figure(fig):
+    """Render a matplotlib figure and close it so pyplot does not keep it alive."""
+    st.pyplot(fig)
+    plt.close(fig)
+
 # Custom CSS for retro gaming aesthetic
 def load_css():
     st.markdown("""
@@ -183,50 +198,49 @@ if 'page' not in st.session_state:
     st.session_state.page = 'dashboard'
 if 'current_user' not in st.session_state:
     st.session_state.current_user = None
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
 
 # Data file path
-DATA_DIR = "data"
+DATA_DIR = os.environ.get("SYNAPSE_DATA_DIR", "data")
 os.makedirs(DATA_DIR, exist_ok=True)
 
 # Functions for data handling
 def save_data(data, username):
     """Save user data to CSV."""
-    filepath = os.path.join(DATA_DIR, f"{username}.csv")
-    data.to_csv(filepath, index=False)
+    with user_lock(username, DATA_DIR):
+        write_user_data(data, username, DATA_DIR)
 
 def load_data(username):
     """Load user data from CSV."""
-    filepath = os.path.join(DATA_DIR, f"{username}.csv")
-    if os.path.exists(filepath):
-        return pd.read_csv(filepath)
-    else:
-        return pd.DataFrame(columns=['date', 'mood', 'stress', 'sleep_hours', 'activity_minutes', 'symptoms'])
+    return load_user_data(username, DATA_DIR)
 
-def add_entry(data, entry):
-    """Add a new entry to the user data."""
-    return pd.concat([data, pd.DataFrame([entry])], ignore_index=True)
+def add_entry(username, entry):
+    """Save a manual entry, replacing the user's manual entry for that date.
+
+    Merges into the stored data so entries ingested since login are kept.
+    """
+    entry = pd.DataFrame([{**entry, 'source': MANUAL_SOURCE}])
+    data, _, _ = merge_user_entries(username, entry, DATA_DIR)
+    return data
 
 # Functions for insights
-def generate_trend_insight(data):
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_lagged_correlations(version, _data):
+    """Cache lag correlations per data version; `_data` is not hashed."""
+    return find_lagged_correlations(_data)
+
+def generate_trend_insight(data, max_correlations=3):
     """Generate simple insights about trends in the data."""
     if len(data) < 5:
         return "Need more data to generate insights."
     
     insights = []
     
-    # Check for mood-sleep correlation
-    if 'mood' in data.columns and 'sleep_hours' in data.columns:
-        correlation = data['mood'].corr(data['sleep_hours'])
-        if abs(correlation) > 0.5:
-            direction = "positively" if correlation > 0 else "negatively"
-            insights.append(f"Your mood appears to be {direction} correlated with your sleep.")
-    
-    # Check for stress-activity correlation
-    if 'stress' in data.columns and 'activity_minutes' in data.columns:
-        correlation = data['stress'].corr(data['activity_minutes'])
-        if abs(correlation) > 0.5:
-            direction = "increase" if correlation > 0 else "decrease"
-            insights.append(f"Your stress levels tend to {direction} with more physical activity.")
+    # Strongest significant correlations across all metric pairs and lags
+    correlations = cached_lagged_correlations(data_version(data), data)
+    for _, row in correlations.head(max_correlations).iterrows():
+        insights.append(describe_correlation(row))
     
     # Check for recent mood trends
     if 'mood' in data.columns and len(data) >= 7:
@@ -239,6 +253,134 @@ def generate_trend_insight(data):
     
     return insights if insights else "No significant trends detected yet."
 
+# Functions for symptoms
+def get_symptom_index(data):
+    """Return the session's symptom index, brought up to date with `data`."""
+    index = st.session_state.get('symptom_index')
+    if index is None or index.n_rows > len(data):
+        index = SymptomIndex()
+    st.session_state.symptom_index = index.update(data)
+    return index
+
+# Functions for session memory
+SESSION_IDLE_SECONDS = float(os.environ.get("SYNAPSE_SESSION_IDLE_SECONDS", 15 * 60))
+SESSION_MEMORY_CAP_MB = float(os.environ.get("SYNAPSE_SESSION_MEMORY_CAP_MB", 64))
+# Session state that can always be rebuilt from storage, cheapest to rebuild last
+RELOADABLE_STATE = ['user_data', 'symptom_index']
+
+def estimate_bytes(value):
+    """Approximate memory held by a session state value."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, SymptomIndex):
+        return value.memory_bytes()
+    return sys.getsizeof(value)
+
+def session_memory_bytes(state):
+    """Approximate memory held by one session's state."""
+    return sum(estimate_bytes(state[key]) for key in list(state.keys()))
+
+def evict_user_data(data):
+    """Empty a history DataFrame in place and mark it for reloading."""
+    data.drop(index=data.index, inplace=True)
+    data.attrs['evicted'] = True
+
+class SessionMemoryManager:
+    """Process-wide registry of sessions, their memory use and last activity.
+
+    The registry only holds weak references to each session's history and
+    symptom index, so it never keeps a closed session's data alive. Once a
+    session has been idle too long both are emptied in place and the session
+    reloads from storage on its next rerun.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = {}
+
+    def touch(self, session_id, user, data, index, nbytes):
+        """Record activity and current memory use for a session."""
+        with self.lock:
+            self.sessions[session_id] = {
+                'data': weakref.ref(data) if data is not None else None,
+                'index': weakref.ref(index) if index is not None else None,
+                'user': user,
+                'last_seen': time.monotonic(),
+                'bytes': nbytes,
+            }
+
+    def mark_active(self, session_id):
+        """Refresh a session's last activity so it is not evicted mid-rerun."""
+        with self.lock:
+            if session_id in self.sessions:
+                self.sessions[session_id]['last_seen'] = time.monotonic()
+
+    def evict_idle(self, idle_seconds=SESSION_IDLE_SECONDS):
+        """Drop the history of sessions idle for more than `idle_seconds`."""
+        now = time.monotonic()
+        evicted = 0
+        with self.lock:
+            for session_id, entry in list(self.sessions.items()):
+                data = entry['data']() if entry['data'] is not None else None
+                index = entry['index']() if entry['index'] is not None else None
+                if now - entry['last_seen'] <= idle_seconds:
+                    continue
+                if data is not None:
+                    evict_user_data(data)
+                if index is not None:
+                    index.clear()
+                evicted += data is not None or index is not None
+                del self.sessions[session_id]
+        return evicted
+
+    def usage(self):
+        """Per-session memory usage, largest first."""
+        now = time.monotonic()
+        with self.lock:
+            rows = [{
+                'session': session_id[:8],
+                'user': entry['user'],
+                'idle_seconds': round(now - entry['last_seen']),
+                'memory_mb': entry['bytes'] / 2 ** 20,
+            } for session_id, entry in self.sessions.items()]
+        usage = pd.DataFrame(rows, columns=['session', 'user', 'idle_seconds', 'memory_mb'])
+        return usage.sort_values('memory_mb', ascending=False).reset_index(drop=True)
+
+@st.cache_resource
+def get_session_memory_manager():
+    """The single SessionMemoryManager shared by every session of this server."""
+    return SessionMemoryManager()
+
+def restore_session_data():
+    """Reload the current user's history if it was evicted."""
+    data = st.session_state.get('user_data')
+    if data is None or data.attrs.get('evicted'):
+        if st.session_state.current_user is None:
+            st.session_state.user_data = pd.DataFrame()
+        else:
+            st.session_state.user_data = load_data(st.session_state.current_user)
+
+def enforce_session_memory_cap(cap_mb=SESSION_MEMORY_CAP_MB):
+    """Record this session's memory use, dropping reloadable state above the cap.
+
+    Derived state goes first; if the history alone is over the cap it is not
+    kept between reruns and is reloaded from storage each time.
+    """
+    cap = cap_mb * 2 ** 20
+    nbytes = session_memory_bytes(st.session_state)
+    for key in reversed(RELOADABLE_STATE):
+        if nbytes <= cap:
+            break
+        nbytes -= estimate_bytes(st.session_state.get(key))
+        st.session_state[key] = None
+    get_session_memory_manager().touch(
+        st.session_state.session_id,
+        st.session_state.current_user,
+        st.session_state.get('user_data'),
+        st.session_state.get('symptom_index'),
+        nbytes,
+    )
+
 def detect_anomalies(data):
     """Detect simple anomalies in the user data."""
     if len(data) < 7:
@@ -267,6 +409,11 @@ def detect_anomalies(data):
     
     return anomalies if anomalies else "No anomalies detected."
 
+# Mark this session active before evicting idle ones, then reload anything it lost
+get_session_memory_manager().mark_active(st.session_state.session_id)
+get_session_memory_manager().evict_idle()
+restore_session_data()
+
 # Sidebar
 with st.sidebar:
     st.markdown('<h1 style="text-align: center;">SYNAPSE CORE</h1>', unsafe_allow_html=True)
@@ -276,9 +423,12 @@ with st.sidebar:
     if st.session_state.current_user is None:
         username = st.text_input("Enter Your Username", key="username_input")
         if st.button("START"):
-            if username:
+            if username and not valid_username(username):
+                st.error("Usernames cannot contain path separators.")
+            elif username:
                 st.session_state.current_user = username
                 st.session_state.user_data = load_data(username)
+                st.session_state.symptom_index = None
                 st.rerun()
     else:
         st.markdown(f"<h3>PLAYER: {st.session_state.current_user}</h3>", unsafe_allow_html=True)
@@ -298,6 +448,8 @@ with st.sidebar:
         
         if st.button("LOGOUT"):
             st.session_state.current_user = None
+            st.session_state.user_data = pd.DataFrame()
+            st.session_state.symptom_index = None
             st.rerun()
 
 # Main content
@@ -344,7 +496,8 @@ elif st.session_state.page == 'dashboard':
         
         cols = st.columns(4)
         
-        recent_data = st.session_state.user_data.iloc[-1] if len(st.session_state.user_data) > 0 else None
+        # Latest known value of each metric, since external sources may only report some
+        recent_data = st.session_state.user_data.ffill().iloc[-1].fillna(0) if len(st.session_state.user_data) > 0 else None
         
         if recent_data is not None:
             # Mood meter
@@ -356,7 +509,7 @@ elif st.session_state.page == 'dashboard':
                 <div class="health-bar">
                     <div class="health-bar-inner" style="width: {mood_percentage}%;"></div>
                 </div>
-                <p style="text-align: center;">{mood}/10</p>
+                <p style="text-align: center;">{mood:g}/10</p>
                 """, unsafe_allow_html=True)
             
             # Stress meter
@@ -368,7 +521,7 @@ elif st.session_state.page == 'dashboard':
                 <div class="health-bar">
                     <div class="health-bar-inner" style="width: {stress_percentage}%;"></div>
                 </div>
-                <p style="text-align: center;">{stress}/10</p>
+                <p style="text-align: center;">{stress:g}/10</p>
                 """, unsafe_allow_html=True)
             
             # Sleep meter
@@ -380,7 +533,7 @@ elif st.session_state.page == 'dashboard':
                 <div class="health-bar">
                     <div class="health-bar-inner" style="width: {sleep_percentage}%;"></div>
                 </div>
-                <p style="text-align: center;">{sleep} hours</p>
+                <p style="text-align: center;">{sleep:g} hours</p>
                 """, unsafe_allow_html=True)
             
             # Activity meter
@@ -392,7 +545,7 @@ elif st.session_state.page == 'dashboard':
                 <div class="health-bar">
                     <div class="health-bar-inner" style="width: {activity_percentage}%;"></div>
                 </div>
-                <p style="text-align: center;">{activity} mins</p>
+                <p style="text-align: center;">{activity:g} mins</p>
                 """, unsafe_allow_html=True)
         
         # Charts
@@ -433,7 +586,7 @@ elif st.session_state.page == 'dashboard':
                 for spine in ['top', 'right']:
                     ax.spines[spine].set_visible(False)
                 
-                st.pyplot(fig)
+                render_figure(fig)
             else:
                 st.markdown('<p>No mood or stress data available</p>', unsafe_allow_html=True)
         
@@ -466,7 +619,7 @@ elif st.session_state.page == 'dashboard':
                 for spine in ['top', 'right']:
                     ax.spines[spine].set_visible(False)
                 
-                st.pyplot(fig)
+                render_figure(fig)
             else:
                 st.markdown('<p>No sleep data available</p>', unsafe_allow_html=True)
         
@@ -499,7 +652,7 @@ elif st.session_state.page == 'dashboard':
                 for spine in ['top', 'right']:
                     ax.spines[spine].set_visible(False)
                 
-                st.pyplot(fig)
+                render_figure(fig)
             else:
                 st.markdown('<p>No activity data available</p>', unsafe_allow_html=True)
         
@@ -509,6 +662,67 @@ elif st.session_state.page == 'dashboard':
                 symptom_data = symptom_data[symptom_data['symptoms'].notna() & (symptom_data['symptoms'] != '')]
                 
                 if len(symptom_data) > 0:
+                    symptom_index = get_symptom_index(st.session_state.user_data)
+                    frequencies = symptom_index.frequencies()
+                    
+                    if len(frequencies) > 0:
+                        st.markdown('<h3>SYMPTOM FREQUENCY</h3>', unsafe_allow_html=True)
+                        
+                        # Create retro-style plot
+                        top_symptoms = frequencies.head(10).iloc[::-1]
+                        fig, ax = plt.subplots(figsize=(10, max(3, 0.5 * len(top_symptoms))))
+                        fig, ax = configure_plot_for_dark_theme(fig, ax)
+                        
+                        # Plot counts with horizontal bars for retro feel
+                        ax.barh(top_symptoms.index, top_symptoms.values, color='white', height=0.6)
+                        
+                        # Add grid for retro feel
+                        ax.grid(True, linestyle='--', alpha=0.7, axis='x')
+                        
+                        # Set labels
+                        ax.set_xlabel('Entries')
+                        ax.set_title('Most Reported Symptoms')
+                        
+                        # Remove spines
+                        for spine in ['top', 'right']:
+                            ax.spines[spine].set_visible(False)
+                        
+                        render_figure(fig)
+                        
+                        # Symptoms that tend to show up together
+                        pairs = symptom_index.top_pairs(5)
+                        if pairs:
+                            st.markdown('<h3>OFTEN TOGETHER</h3>', unsafe_allow_html=True)
+                            for (first, second), count in pairs:
+                                st.markdown(f"<p>» {first} + {second}: {count} entries</p>", unsafe_allow_html=True)
+                        
+                        # How each symptom relates to the tracked metrics
+                        associations = symptom_metric_associations(symptom_index, st.session_state.user_data)
+                        if len(associations) > 0:
+                            st.markdown('<h3>SYMPTOMS VS. METRICS</h3>', unsafe_allow_html=True)
+                            for _, row in associations.head(5).iterrows():
+                                direction = "higher" if row['difference'] > 0 else "lower"
+                                st.markdown(f"""<p>» {METRIC_LABELS[row['metric']].capitalize()} is {abs(row['difference']):.1f} {direction} on days with {row['symptom']} ({row['with_symptom']:.1f} vs. {row['without_symptom']:.1f})</p>""", unsafe_allow_html=True)
+                        
+                        # Symptom search
+                        st.markdown('<h3>SEARCH DAYS</h3>', unsafe_allow_html=True)
+                        query_cols = st.columns(4)
+                        with query_cols[0]:
+                            selected = st.multiselect("Symptoms", list(frequencies.index), key="symptom_query")
+                        with query_cols[1]:
+                            metric = st.selectbox("Metric", ['(any)'] + METRIC_COLUMNS, key="symptom_query_metric")
+                        with query_cols[2]:
+                            op = st.selectbox("Condition", list(METRIC_OPERATORS), key="symptom_query_op")
+                        with query_cols[3]:
+                            value = st.number_input("Value", value=6.0, key="symptom_query_value")
+                        
+                        if selected or metric != '(any)':
+                            conditions = [(metric, op, value)] if metric in st.session_state.user_data.columns else []
+                            matches = query_symptom_days(symptom_index, st.session_state.user_data, selected, conditions)
+                            st.markdown(f'<p>{len(matches)} matching days</p>', unsafe_allow_html=True)
+                            if len(matches) > 0:
+                                st.dataframe(matches, hide_index=True)
+                    
                     st.markdown('<h3>REPORTED SYMPTOMS</h3>', unsafe_allow_html=True)
                     
                     # Display symptoms with retro styling
@@ -575,11 +789,13 @@ elif st.session_state.page == 'add_data':
                 'symptoms': symptoms
             }
             
-            # Add to dataframe
-            st.session_state.user_data = add_entry(st.session_state.user_data, entry)
-            
             # Save data
-            save_data(st.session_state.user_data, st.session_state.current_user)
+            previous_seq = st.session_state.user_data.get('seq', pd.Series(dtype='int64')).to_numpy()
+            st.session_state.user_data = add_entry(st.session_state.current_user, entry)
+            
+            # The symptom index is positional, so rebuild it unless rows were only appended
+            if not np.array_equal(st.session_state.user_data['seq'].to_numpy()[:len(previous_seq)], previous_seq):
+                st.session_state.symptom_index = None
             
             st.success("Health data saved successfully!")
 
@@ -633,7 +849,18 @@ elif st.session_state.page == 'insights':
         
         # Basic correlation analysis
         st.markdown('<h2>CORRELATION ANALYSIS</h2>', unsafe_allow_html=True)
-        
+
+        # Significant pairs across all metrics and lags
+        correlations = cached_lagged_correlations(data_version(st.session_state.user_data), st.session_state.user_data)
+        if len(correlations) > 0:
+            st.markdown('<h3>LAGGED EFFECTS (0-7 DAYS)</h3>', unsafe_allow_html=True)
+            for _, row in correlations.iterrows():
+                st.markdown(f"""
+                <div style="border: 2px solid white; padding: 0.5rem; margin-bottom: 0.5rem;">
+                    <p style="margin: 0;">» {describe_correlation(row)} (r = {row['correlation']:.2f}, {row['days']} days)</p>
+                </div>
+                """, unsafe_allow_html=True)
+
         if 'mood' in st.session_state.user_data.columns and 'sleep_hours' in st.session_state.user_data.columns:
             # Create retro-style scatter plot
             fig, ax = plt.subplots(figsize=(8, 8))
@@ -660,10 +887,11 @@ elif st.session_state.page == 'insights':
                 ax.spines[spine].set_visible(False)
             
             # Add correlation line if there are enough points
-            if len(st.session_state.user_data) >= 3:
+            paired = st.session_state.user_data[['sleep_hours', 'mood']].dropna()
+            if len(paired) >= 3:
                 # Prepare data for linear regression
-                X = st.session_state.user_data['sleep_hours'].values.reshape(-1, 1)
-                y = st.session_state.user_data['mood'].values
+                X = paired['sleep_hours'].values.reshape(-1, 1)
+                y = paired['mood'].values
                 
                 # Fit linear regression model
                 model = LinearRegression()
@@ -681,7 +909,7 @@ elif st.session_state.page == 'insights':
                 ax.text(0.05, 0.95, f"Correlation: {corr:.2f}", transform=ax.transAxes,
                         fontsize=12, verticalalignment='top')
             
-            st.pyplot(fig)
+            render_figure(fig)
         
         if 'stress' in st.session_state.user_data.columns and 'activity_minutes' in st.session_state.user_data.columns:
             # Create retro-style scatter plot
@@ -709,10 +937,11 @@ elif st.session_state.page == 'insights':
                 ax.spines[spine].set_visible(False)
             
             # Add correlation line if there are enough points
-            if len(st.session_state.user_data) >= 3:
+            paired = st.session_state.user_data[['activity_minutes', 'stress']].dropna()
+            if len(paired) >= 3:
                 # Prepare data for linear regression
-                X = st.session_state.user_data['activity_minutes'].values.reshape(-1, 1)
-                y = st.session_state.user_data['stress'].values
+                X = paired['activity_minutes'].values.reshape(-1, 1)
+                y = paired['stress'].values
                 
                 # Fit linear regression model
                 model = LinearRegression()
@@ -730,7 +959,7 @@ elif st.session_state.page == 'insights':
                 ax.text(0.05, 0.95, f"Correlation: {corr:.2f}", transform=ax.transAxes,
                         fontsize=12, verticalalignment='top')
             
-            st.pyplot(fig)
+            render_figure(fig)
 
 # Settings page
 elif st.session_state.page == 'settings':
@@ -750,6 +979,19 @@ elif st.session_state.page == 'settings':
     else:
         st.markdown('<p>No data to export</p>', unsafe_allow_html=True)
     
+    # Memory usage
+    st.markdown('<h2>MEMORY</h2>', unsafe_allow_html=True)
+    
+    # Record this session first so the table includes its current usage
+    enforce_session_memory_cap()
+    session_mb = session_memory_bytes(st.session_state) / 2 ** 20
+    usage = get_session_memory_manager().usage()
+    st.markdown(f"""
+    <p>This session: {session_mb:.2f} MB of {SESSION_MEMORY_CAP_MB:g} MB</p>
+    <p>Server: {len(usage)} sessions, {usage['memory_mb'].sum():.1f} MB</p>
+    """, unsafe_allow_html=True)
+    st.dataframe(usage.round({'memory_mb': 2}), hide_index=True)
+    
     # Clear data option
     st.markdown('<h2>DANGER ZONE</h2>', unsafe_allow_html=True)
     
@@ -758,7 +1000,7 @@ elif st.session_state.page == 'settings':
         
         if confirm:
             if st.button("CONFIRM DELETE"):
-                st.session_state.user_data = pd.DataFrame(columns=['date', 'mood', 'stress', 'sleep_hours', 'activity_minutes', 'symptoms'])
+                st.session_state.user_data = pd.DataFrame(columns=COLUMNS)
                 save_data(st.session_state.user_data, st.session_state.current_user)
                 st.success("All data cleared successfully!")
 
@@ -767,4 +1009,7 @@ st.markdown("""
 <div style="text-align: center; margin-top: 3rem; padding-top: 1rem; border-top: 2px solid white;">
     <p>PROJECT SYNAPSE CORE v0.1.0 | YOUR PERSONAL HEALTH TRACKER</p>
 </div>
-""", unsafe_allow_html=True)
\ No newline at end of file
+""", unsafe_allow_html=True)
+
+# Keep this session within its memory budget
+enforce_session_memory_cap()
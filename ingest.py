@@ -0,0 +1,314 @@
+"""Batch ingestion and delta-sync export for wearable and external sources.
+
+Entries are keyed by (user, date, source), so re-sending a batch is a no-op
+and a newer value for the same key updates the stored entry in place. Each
+user's file is read and written once per batch. Every stored entry carries a
+per-user sequence number `seq` that increases whenever the entry changes,
+which downstream consumers use as a sync cursor.
+
+Usage:
+    python ingest.py import batch.ndjson
+    python ingest.py import batch.arrow --format arrow
+    cat batch.ndjson | python ingest.py import -
+    python ingest.py export alice --since 120 > changes.ndjson
+
+An NDJSON entry looks like:
+    {"user": "alice", "date": "2024-05-01", "source": "fitbit", "sleep_hours": 7.5}
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+DATA_DIR = os.environ.get("SYNAPSE_DATA_DIR", "data")
+METRIC_COLUMNS = ['mood', 'stress', 'sleep_hours', 'activity_minutes']
+VALUE_COLUMNS = METRIC_COLUMNS + ['symptoms']
+COLUMNS = ['date'] + VALUE_COLUMNS + ['source', 'seq']
+KEY_COLUMNS = ['date', 'source']
+MANUAL_SOURCE = 'manual'
+
+
+def valid_username(username):
+    """Whether `username` can safely name a file inside the data directory."""
+    return (isinstance(username, str) and username not in ('', '.', '..')
+            and os.path.basename(username) == username)
+
+
+def user_path(username, data_dir=DATA_DIR, suffix=".csv"):
+    """Path of a user's file, rejecting names that would escape `data_dir`."""
+    if not valid_username(username):
+        raise ValueError(f"invalid username: {username!r}")
+    return os.path.join(data_dir, f"{username}{suffix}")
+
+
+def read_high_water(username, data_dir=DATA_DIR):
+    """Highest sequence number ever written for a user, even if since cleared."""
+    try:
+        with open(user_path(username, data_dir, ".seq")) as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+@contextlib.contextmanager
+def user_lock(username, data_dir=DATA_DIR):
+    """Hold an exclusive lock on a user's files for a read-modify-write.
+
+    The app and the import command lock the same `<user>.lock` file, so
+    concurrent writers never drop each other's entries. Without fcntl the
+    lock is a no-op.
+    """
+    with open(user_path(username, data_dir, ".lock"), "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def ensure_sync_columns(data):
+    """Add `source` and `seq` to data written before they existed.
+
+    Entries without a source are manual entries, and entries without a
+    sequence number are numbered in file order after any existing ones.
+    """
+    data = data.copy()
+    if 'source' not in data.columns:
+        data['source'] = MANUAL_SOURCE
+    data['source'] = data['source'].fillna(MANUAL_SOURCE)
+    seq = pd.to_numeric(data['seq'], errors='coerce') if 'seq' in data.columns else pd.Series(np.nan, index=data.index)
+    missing = seq.isna()
+    start = int(seq.max()) if seq.notna().any() else 0
+    seq[missing] = np.arange(start + 1, start + 1 + missing.sum())
+    data['seq'] = seq.astype('int64')
+    return data
+
+
+def next_sequence(data, high_water=0):
+    """Sequence number for the next change to `data`.
+
+    `high_water` keeps the sequence increasing after entries are deleted, so
+    sync cursors held by downstream consumers never run ahead of new data.
+    """
+    current = len(data)
+    if 'seq' in data.columns and len(data) > 0:
+        current = int(pd.to_numeric(data['seq'], errors='coerce').max())
+    return max(current, high_water) + 1
+
+
+def load_user_data(username, data_dir=DATA_DIR):
+    """Load a user's entries with sync columns filled in."""
+    filepath = user_path(username, data_dir)
+    if os.path.exists(filepath):
+        return ensure_sync_columns(pd.read_csv(filepath, float_precision='round_trip'))
+    return pd.DataFrame(columns=COLUMNS)
+
+
+def write_atomic(filepath, write):
+    """Write a file through a temporary copy so readers never see it half-written."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(filepath) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", newline="") as f:
+            write(f)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def write_user_data(data, username, data_dir=DATA_DIR):
+    """Write a user's entries atomically, recording the sequence high-water mark.
+
+    The mark is written first so it can never fall behind the stored data.
+    """
+    filepath = user_path(username, data_dir)
+    high_water = next_sequence(data, read_high_water(username, data_dir)) - 1
+    write_atomic(user_path(username, data_dir, ".seq"), lambda f: f.write(f"{high_water}\n"))
+    write_atomic(filepath, lambda f: data.to_csv(f, index=False))
+
+
+def read_batch(stream, fmt="ndjson"):
+    """Read a batch of entries from an NDJSON or Arrow IPC byte stream."""
+    if fmt == "ndjson":
+        text = stream.read().decode("utf-8")
+        if not text.strip():
+            return pd.DataFrame(columns=['user'] + COLUMNS[:-1])
+        return pd.read_json(io.StringIO(text), lines=True, dtype=False, convert_dates=False)
+    if fmt == "arrow":
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise RuntimeError("Arrow input needs pyarrow: pip install pyarrow")
+        buffer = pa.py_buffer(stream.read())
+        try:
+            return pa.ipc.open_file(buffer).read_pandas()
+        except pa.ArrowInvalid:
+            return pa.ipc.open_stream(buffer).read_pandas()
+    raise ValueError(f"unknown format: {fmt}")
+
+
+def normalize_dates(dates):
+    """Calendar date of each entry as YYYY-MM-DD, or NaN if not ISO 8601.
+
+    Dates and timestamps may be mixed in one batch. A timestamp with a UTC
+    offset keeps the local date it was recorded on rather than its UTC date,
+    so a 07:00+02:00 reading counts for the day the user lived it.
+    """
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        if dates.dt.tz is not None:
+            dates = dates.dt.tz_localize(None)
+        return dates.dt.strftime('%Y-%m-%d')
+    text = dates.astype('string').str.extract(r'^\s*(\d{4}-\d{2}-\d{2})', expand=False)
+    return pd.to_datetime(text, format='%Y-%m-%d', errors='coerce').dt.strftime('%Y-%m-%d')
+
+
+def normalize_batch(batch):
+    """Validate and normalize a batch, collapsing entries that share a key.
+
+    Later entries for the same (user, date, source) override earlier ones
+    field by field, the same way `merge_entries` applies them to storage.
+
+    Returns the clean batch and the number of rejected entries (missing or
+    invalid user, or unparseable date).
+    """
+    batch = batch.copy()
+    for col in ['user', 'date'] + VALUE_COLUMNS + ['source']:
+        if col not in batch.columns:
+            batch[col] = np.nan
+    batch['source'] = batch['source'].fillna(MANUAL_SOURCE).astype(str)
+    batch['date'] = normalize_dates(batch['date'])
+    batch[METRIC_COLUMNS] = batch[METRIC_COLUMNS].apply(pd.to_numeric, errors='coerce')
+
+    batch['user'] = batch['user'].map(lambda user: str(user) if pd.notna(user) else None)
+    valid = batch['user'].map(valid_username).astype(bool) & batch['date'].notna()
+    rejected = int((~valid).sum())
+    batch = batch[valid].groupby(['user'] + KEY_COLUMNS, sort=False).last().reset_index()
+    return batch[['user', 'date'] + VALUE_COLUMNS + ['source']], rejected
+
+
+def merge_entries(existing, incoming, high_water=0):
+    """Merge one user's incoming entries into their existing entries.
+
+    Values present in `incoming` override stored ones for the same
+    (date, source); missing values keep what was stored. Only entries whose
+    values actually change get a new sequence number. Returns the merged data
+    and the number of inserted and updated entries.
+    """
+    existing = existing.reset_index(drop=True)
+    incoming = incoming.reset_index(drop=True)
+    seq = next_sequence(existing, high_water)
+
+    # Row of the latest stored entry for each key, or NaN for new keys
+    latest = pd.Series(existing.index, index=pd.MultiIndex.from_frame(existing[KEY_COLUMNS]))
+    latest = latest[~latest.index.duplicated(keep='last')]
+    position = latest.reindex(pd.MultiIndex.from_frame(incoming[KEY_COLUMNS])).to_numpy()
+    matched = ~np.isnan(position)
+
+    # Updates: overlay incoming values on the stored ones and keep real changes
+    rows = position[matched].astype(int)
+    stored = existing.loc[rows, VALUE_COLUMNS].reset_index(drop=True)
+    merged = incoming.loc[matched, VALUE_COLUMNS].reset_index(drop=True).combine_first(stored)[VALUE_COLUMNS]
+    same = (merged == stored) | (merged.isna() & stored.isna())
+    changed = ~same.all(axis=1).to_numpy()
+    if changed.any():
+        updates = merged[changed].set_axis(rows[changed])
+        updates['seq'] = np.arange(seq, seq + changed.sum())
+        for col in VALUE_COLUMNS + ['seq']:
+            existing[col] = updates[col].combine_first(existing[col])
+        seq += int(changed.sum())
+
+    # Inserts: append new keys in one concat
+    new = incoming.loc[~matched, ['date'] + VALUE_COLUMNS + ['source']].copy()
+    new['seq'] = np.arange(seq, seq + len(new))
+    parts = [existing[COLUMNS], new[COLUMNS]] if len(existing) else [new[COLUMNS]]
+    data = pd.concat(parts, ignore_index=True)
+    data['seq'] = data['seq'].astype('int64')
+
+    # Keep the history in date order, which the dashboard's recent-entry views rely on
+    data = data.sort_values('date', kind='stable').reset_index(drop=True)
+    return data, len(new), int(changed.sum())
+
+
+def merge_user_entries(username, entries, data_dir=DATA_DIR):
+    """Merge entries into a user's stored data while holding their lock.
+
+    The file is rewritten only if something changed. Returns the stored data
+    and the number of inserted and updated entries.
+    """
+    with user_lock(username, data_dir):
+        existing = load_user_data(username, data_dir)
+        high_water = read_high_water(username, data_dir)
+        data, inserted, updated = merge_entries(existing, entries, high_water)
+        if inserted or updated:
+            write_user_data(data, username, data_dir)
+    return data, inserted, updated
+
+
+def ingest_batch(batch, data_dir=DATA_DIR):
+    """Merge a batch into storage with one read and one write per user."""
+    batch, rejected = normalize_batch(batch)
+    summary = {'users': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'rejected': rejected}
+    for username, entries in batch.groupby('user', sort=False):
+        _, inserted, updated = merge_user_entries(username, entries.drop(columns='user'), data_dir)
+        summary['users'] += 1
+        summary['inserted'] += inserted
+        summary['updated'] += updated
+        summary['unchanged'] += len(entries) - inserted - updated
+    return summary
+
+
+def changes_since(username, cursor=0, data_dir=DATA_DIR):
+    """Entries changed after `cursor`, in sequence order.
+
+    Pass the largest `seq` received as the next cursor.
+    """
+    data = load_user_data(username, data_dir)
+    return data[data['seq'] > cursor].sort_values('seq').reset_index(drop=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data-dir", default=DATA_DIR,
+                        help="directory holding the user CSV files (default: $SYNAPSE_DATA_DIR or data)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_cmd = commands.add_parser("import", help="merge a batch of entries into storage")
+    import_cmd.add_argument("path", help="batch file, or - for stdin")
+    import_cmd.add_argument("--format", choices=["ndjson", "arrow"], default="ndjson")
+
+    export_cmd = commands.add_parser("export", help="print entries changed since a cursor as NDJSON")
+    export_cmd.add_argument("user")
+    export_cmd.add_argument("--since", type=int, default=0, help="last seq already received (default: 0)")
+
+    args = parser.parse_args(argv)
+    os.makedirs(args.data_dir, exist_ok=True)
+
+    if args.command == "import":
+        if args.path == "-":
+            batch = read_batch(sys.stdin.buffer, args.format)
+        else:
+            with open(args.path, "rb") as f:
+                batch = read_batch(f, args.format)
+        print(json.dumps(ingest_batch(batch, args.data_dir)))
+    else:
+        changes = changes_since(args.user, args.since, args.data_dir)
+        if len(changes):
+            changes.to_json(sys.stdout, orient="records", lines=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""Lag-aware correlation engine for the tracked health metrics.
+
+Correlates every metric with every other one at lags of 0 to 7 days in a
+single vectorized pass, and keeps only pairs that survive false discovery
+rate control.
+"""
+import numpy as np
+import pandas as pd
+from scipy import special
+
+METRIC_COLUMNS = ['mood', 'stress', 'sleep_hours', 'activity_minutes']
+METRIC_LABELS = {
+    'mood': 'mood',
+    'stress': 'stress',
+    'sleep_hours': 'sleep',
+    'activity_minutes': 'physical activity',
+}
+MAX_LAG_DAYS = 7
+MIN_PAIRED_DAYS = 5
+MIN_ABS_CORRELATION = 0.3
+FALSE_DISCOVERY_RATE = 0.05
+
+
+def data_version(data):
+    """Fingerprint the user data so cached results are reused until it changes."""
+    if len(data) == 0:
+        return 0
+    return int(pd.util.hash_pandas_object(data, index=False).sum()) ^ len(data)
+
+
+def build_daily_matrix(data):
+    """Build a (days x metrics) array on a continuous daily calendar.
+
+    Several entries on the same day are averaged and missing days are NaN, so
+    that shifting by one row always means shifting by one day.
+    """
+    metrics = [col for col in METRIC_COLUMNS if col in data.columns]
+    values = data[metrics].apply(pd.to_numeric, errors='coerce')
+    if 'date' in data.columns:
+        dates = pd.to_datetime(data['date'], errors='coerce')
+        daily = values[dates.notna().values].groupby(dates.dropna().values).mean()
+        if len(daily) > 0:
+            daily = daily.reindex(pd.date_range(daily.index.min(), daily.index.max(), freq='D'))
+    else:
+        daily = values.reset_index(drop=True)
+    return metrics, daily.to_numpy(dtype=float)
+
+
+def lagged_correlation_matrix(values, max_lag=MAX_LAG_DAYS):
+    """Pearson correlation of every metric pair at every lag, in one pass.
+
+    Returns ``(r, n)`` with shape ``(max_lag + 1, k, k)`` where ``r[lag, i, j]``
+    correlates metric ``i`` on day ``t - lag`` with metric ``j`` on day ``t``,
+    using only the days where both values are present.
+    """
+    days, k = values.shape
+    lags = np.arange(max_lag + 1)
+
+    # Centre each column first to keep the running sums well conditioned
+    centred = values - np.nanmean(values, axis=0) if days else values
+
+    # leading[lag, t] holds the value recorded `lag` days before day t
+    leading = np.full((len(lags), days, k), np.nan)
+    for lag in lags[lags < days]:
+        leading[lag, lag:] = centred[:days - lag]
+
+    lead_mask = np.isfinite(leading)
+    follow_mask = np.isfinite(centred)
+    lead = np.where(lead_mask, leading, 0.0)
+    follow = np.where(follow_mask, centred, 0.0)
+    lead_mask = lead_mask.astype(float)
+    follow_mask = follow_mask.astype(float)
+
+    n = np.einsum('lti,tj->lij', lead_mask, follow_mask)
+    sum_x = np.einsum('lti,tj->lij', lead, follow_mask)
+    sum_y = np.einsum('lti,tj->lij', lead_mask, follow)
+    sum_xy = np.einsum('lti,tj->lij', lead, follow)
+    sum_xx = np.einsum('lti,tj->lij', lead ** 2, follow_mask)
+    sum_yy = np.einsum('lti,tj->lij', lead_mask, follow ** 2)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = n * sum_xy - sum_x * sum_y
+        var = (n * sum_xx - sum_x ** 2) * (n * sum_yy - sum_y ** 2)
+        r = np.where(var > 0, cov / np.sqrt(var), np.nan)
+    return np.clip(r, -1.0, 1.0), n.astype(int)
+
+
+def correlation_p_values(r, n):
+    """Two-sided p-values for correlations using the Fisher z-transform."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = np.arctanh(np.clip(r, -0.999999, 0.999999)) * np.sqrt(n - 3)
+    p = np.full(r.shape, np.nan)
+    valid = np.isfinite(z) & (n > 3)
+    p[valid] = special.erfc(np.abs(z[valid]) / np.sqrt(2))
+    return p
+
+
+def benjamini_hochberg(p_values):
+    """Benjamini-Hochberg adjusted p-values (q-values) for a 1-D array."""
+    m = len(p_values)
+    if m == 0:
+        return p_values
+    order = np.argsort(p_values)
+    ranked = p_values[order] * m / np.arange(1, m + 1)
+    ranked = np.minimum.accumulate(ranked[::-1])[::-1]
+    q_values = np.empty(m)
+    q_values[order] = np.minimum(ranked, 1.0)
+    return q_values
+
+
+def find_lagged_correlations(data, max_lag=MAX_LAG_DAYS):
+    """Find significant metric pairs at lags 0 to `max_lag` days.
+
+    Every distinct pair is tested (same-day pairs once, lagged pairs in both
+    directions) and the false discovery rate is controlled across all of them.
+    """
+    columns = ['leader', 'follower', 'lag_days', 'correlation', 'days', 'p_value', 'q_value']
+    metrics, values = build_daily_matrix(data)
+    if len(metrics) < 2 or len(values) < MIN_PAIRED_DAYS:
+        return pd.DataFrame(columns=columns)
+
+    r, n = lagged_correlation_matrix(values, max_lag)
+    p = correlation_p_values(r, n)
+
+    lag_idx, lead_idx, follow_idx = np.indices(r.shape)
+    tested = (lead_idx != follow_idx) & ((lag_idx > 0) | (lead_idx < follow_idx))
+    tested &= (n >= MIN_PAIRED_DAYS) & np.isfinite(p)
+
+    q = benjamini_hochberg(p[tested])
+    results = pd.DataFrame({
+        'leader': np.array(metrics)[lead_idx[tested]],
+        'follower': np.array(metrics)[follow_idx[tested]],
+        'lag_days': lag_idx[tested],
+        'correlation': r[tested],
+        'days': n[tested],
+        'p_value': p[tested],
+        'q_value': q,
+    }, columns=columns)
+    significant = (results['q_value'] <= FALSE_DISCOVERY_RATE) & \
+        (results['correlation'].abs() >= MIN_ABS_CORRELATION)
+    results = results[significant]
+    return results.reindex(results['correlation'].abs().sort_values(ascending=False).index).reset_index(drop=True)
+
+
+def describe_correlation(row):
+    """Turn one significant correlation into a sentence."""
+    leader = METRIC_LABELS[row['leader']]
+    follower = METRIC_LABELS[row['follower']]
+    if row['lag_days'] == 0:
+        direction = "positively" if row['correlation'] > 0 else "negatively"
+        return f"Your {follower} appears to be {direction} correlated with your {leader}."
+    direction = "higher" if row['correlation'] > 0 else "lower"
+    when = "the day after" if row['lag_days'] == 1 else f"{row['lag_days']} days after"
+    return f"Your {follower} tends to be {direction} {when} more {leader}."
@@ -0,0 +1,233 @@
+"""Load test for app.py using simulated concurrent Streamlit sessions.
+
+Each simulated session is driven headlessly with Streamlit's AppTest through
+login -> dashboard -> add data -> insights -> settings. Concurrent sessions
+run in separate worker processes, each running its sessions back to back:
+AppTest installs and removes a process-wide mock runtime on every run, so
+sessions sharing one process would clobber each other. The harness reports
+rerun latency percentiles, throughput, failed sessions and memory per session
+as concurrency grows.
+
+Usage:
+    python loadtest.py --concurrency 1,4,16 --history-days 730
+    python loadtest.py --max-p95-ms 1500   # exit 1 if p95 regresses
+"""
+import argparse
+import datetime
+import logging
+import os
+import sys
+import multiprocessing
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+SYMPTOM_POOL = ['', '', '', 'headache', 'mild headache, tired', 'sore throat', 'nausea', 'runny nose, cough']
+
+
+def write_synthetic_data(data_dir, usernames, history_days, seed=0):
+    """Write a synthetic health history CSV for each user into `data_dir`."""
+    rng = np.random.default_rng(seed)
+    end = datetime.date.today()
+    dates = pd.date_range(end=end, periods=history_days, freq='D').strftime('%Y-%m-%d')
+    for username in usernames:
+        sleep = np.clip(rng.normal(7, 1.3, history_days), 0, 12).round()
+        data = pd.DataFrame({
+            'date': dates,
+            'mood': np.clip(5 + 0.6 * (np.roll(sleep, 1) - 7) + rng.normal(0, 1.5, history_days), 0, 10).round(),
+            'stress': np.clip(rng.normal(5, 2, history_days), 0, 10).round(),
+            'sleep_hours': sleep,
+            'activity_minutes': np.clip(rng.normal(45, 25, history_days), 0, 180).round(),
+            'symptoms': rng.choice(SYMPTOM_POOL, history_days),
+        })
+        data.to_csv(os.path.join(data_dir, f"{username}.csv"), index=False)
+
+
+def click(at, label, timeout):
+    """Click the first button with `label` and rerun, returning the rerun time."""
+    button = next((b for b in at.button if b.label == label), None)
+    if button is None:
+        errors = [e.value for e in at.exception]
+        raise RuntimeError(f"no {label!r} button on the page; script errors: {errors}")
+    start = time.perf_counter()
+    button.click().run(timeout=timeout)
+    return time.perf_counter() - start
+
+
+def run_session(username, timeout):
+    """Drive one session through the full user flow.
+
+    Returns the AppTest (so its memory stays alive until measured) and the
+    list of rerun latencies in seconds.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    latencies = []
+    # Each run installs the app as __main__; put this module back afterwards so
+    # the worker process can still unpickle the tasks it is sent
+    main_module = sys.modules["__main__"]
+    try:
+        # Initial page load
+        at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        start = time.perf_counter()
+        at.run()
+        latencies.append(time.perf_counter() - start)
+
+        # Login lands on the dashboard
+        at.text_input(key="username_input").set_value(username)
+        latencies.append(click(at, "START", timeout))
+
+        # Add one entry
+        latencies.append(click(at, "ADD HEALTH DATA", timeout))
+        at.text_area[0].set_value("headache")
+        latencies.append(click(at, "SAVE DATA", timeout))
+
+        latencies.append(click(at, "INSIGHTS", timeout))
+        latencies.append(click(at, "SETTINGS", timeout))
+        latencies.append(click(at, "DASHBOARD", timeout))
+    finally:
+        sys.modules["__main__"] = main_module
+
+    if len(at.exception) > 0:
+        raise RuntimeError(f"{username}: {at.exception[0].value}")
+    return at, latencies
+
+
+def current_rss_bytes():
+    """Resident set size of this process, or None if it cannot be read."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def start_worker(history_days, timeout):
+    """Prepare a worker process: quiet Streamlit, then warm up imports and caches.
+
+    Runs before any timed session so no level is charged for the warm-up.
+    """
+    # Sessions run outside a real server, so drop the bare-mode warnings. A
+    # filter survives Streamlit resetting its loggers' levels on config load.
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").addFilter(
+        lambda record: record.levelno >= logging.ERROR)
+
+    username = f"warmup{os.getpid()}"
+    write_synthetic_data(os.environ["SYNAPSE_DATA_DIR"], [username], history_days)
+    run_session(username, timeout)
+
+
+def run_worker(usernames, timeout):
+    """Run sessions back to back in this worker process.
+
+    A session that fails is recorded as an error and the worker moves on, so
+    one failure does not abort the level. Sessions stay alive until the
+    worker's memory growth has been measured.
+    """
+    latencies = []
+    errors = []
+    live_sessions = []
+    rss_before = current_rss_bytes()
+    start = time.time()
+    for username in usernames:
+        try:
+            at, session_latencies = run_session(username, timeout)
+        except Exception as e:
+            errors.append(f"{username}: {e}")
+            continue
+        latencies.extend(session_latencies)
+        live_sessions.append(at)
+    end = time.time()
+    rss_after = current_rss_bytes()
+
+    rss_growth = None
+    if rss_before is not None and rss_after is not None:
+        rss_growth = max(rss_after - rss_before, 0)
+    return {'latencies': latencies, 'errors': errors, 'sessions': len(live_sessions),
+            'start': start, 'end': end, 'rss_growth': rss_growth}
+
+
+def run_level(concurrency, sessions_per_worker, history_days, timeout, user_prefix):
+    """Run `concurrency` worker processes in parallel and collect their metrics."""
+    usernames = [f"{user_prefix}{i}" for i in range(concurrency * sessions_per_worker)]
+    # Spawn rather than fork so each worker starts from a clean interpreter
+    with ProcessPoolExecutor(max_workers=concurrency, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=start_worker, initargs=(history_days, timeout)) as pool:
+        futures = [pool.submit(run_worker, usernames[w * sessions_per_worker:(w + 1) * sessions_per_worker], timeout)
+                   for w in range(concurrency)]
+        workers = [future.result() for future in futures]
+
+    latencies_ms = np.array([latency for w in workers for latency in w['latencies']]) * 1000
+    errors = [error for w in workers for error in w['errors']]
+    sessions = sum(w['sessions'] for w in workers)
+    # Workers report wall-clock times, which are comparable across processes
+    elapsed = max(w['end'] for w in workers) - min(w['start'] for w in workers)
+    if errors:
+        print(f"concurrency={concurrency:<4} {len(errors)} failed sessions, first: {errors[0]}", file=sys.stderr)
+
+    memory_mb = None
+    if sessions and all(w['rss_growth'] is not None for w in workers):
+        memory_mb = sum(w['rss_growth'] for w in workers) / sessions / 2 ** 20
+    percentiles = np.percentile(latencies_ms, [50, 95, 99]) if len(latencies_ms) else [np.nan] * 3
+    return {
+        'concurrency': concurrency,
+        'sessions': sessions,
+        'errors': len(errors),
+        'error_rate': len(errors) / len(usernames),
+        'reruns': len(latencies_ms),
+        'p50_ms': percentiles[0],
+        'p95_ms': percentiles[1],
+        'p99_ms': percentiles[2],
+        'reruns_per_s': len(latencies_ms) / elapsed if elapsed > 0 else np.nan,
+        'mb_per_session': memory_mb,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", default="1,2,4,8",
+                        help="comma-separated numbers of concurrent sessions (default: 1,2,4,8)")
+    parser.add_argument("--sessions-per-worker", type=int, default=2,
+                        help="sessions each worker runs back to back (default: 2)")
+    parser.add_argument("--history-days", type=int, default=365,
+                        help="days of synthetic history per user (default: 365)")
+    parser.add_argument("--timeout", type=float, default=60,
+                        help="per-rerun timeout in seconds (default: 60)")
+    parser.add_argument("--max-p95-ms", type=float, default=None,
+                        help="fail if p95 rerun latency exceeds this at any level")
+    parser.add_argument("--max-error-rate", type=float, default=0.0,
+                        help="fail if the share of failed sessions exceeds this at any level (default: 0)")
+    args = parser.parse_args(argv)
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    with tempfile.TemporaryDirectory(prefix="synapse-load-") as data_dir:
+        # Worker processes inherit the data directory that app.py reads
+        os.environ["SYNAPSE_DATA_DIR"] = data_dir
+
+        results = []
+        for level in levels:
+            prefix = f"load{level}_"
+            write_synthetic_data(data_dir, [f"{prefix}{i}" for i in range(level * args.sessions_per_worker)],
+                                 args.history_days, seed=level)
+            results.append(run_level(level, args.sessions_per_worker, args.history_days, args.timeout, prefix))
+            print(f"concurrency={level:<4} done", file=sys.stderr)
+
+    report = pd.DataFrame(results).set_index('concurrency')
+    print(report.to_string(formatters={'error_rate': "{:.0%}".format}, float_format=lambda value: f"{value:.1f}"))
+
+    failed = False
+    if (report['error_rate'] > args.max_error_rate).any():
+        print(f"FAIL: failed sessions above {args.max_error_rate:.0%}", file=sys.stderr)
+        failed = True
+    if args.max_p95_ms is not None and (report['p95_ms'] > args.max_p95_ms).any():
+        print(f"FAIL: p95 rerun latency above {args.max_p95_ms:.0f} ms", file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
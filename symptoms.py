@@ -0,0 +1,214 @@
+"""Symptom text normalization, indexing and analytics.
+
+Free-text symptom entries are split into normalized terms with integer IDs.
+A per-user inverted index and co-occurrence counts answer frequency and
+"days with X" queries without rescanning the raw text.
+"""
+import operator
+import re
+import sys
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from insights import FALSE_DISCOVERY_RATE, METRIC_COLUMNS, benjamini_hochberg
+
+SYMPTOM_NOT_APPLICABLE = re.compile(r"\bn\s*/\s*a\b|\bn\.a\.?")
+SYMPTOM_SEPARATORS = re.compile(r"[,;/\n]+|\band\b|\bwith\b|&|\+")
+SYMPTOM_QUALIFIERS = {'a', 'an', 'the', 'some', 'mild', 'slight', 'slightly', 'light', 'bad', 'severe',
+                      'very', 'really', 'bit', 'little', 'of', 'minor', 'strong', 'heavy'}
+SYMPTOM_SYNONYMS = {
+    'headaches': 'headache',
+    'head ache': 'headache',
+    'migraines': 'migraine',
+    'tired': 'fatigue',
+    'tiredness': 'fatigue',
+    'exhausted': 'fatigue',
+    'exhaustion': 'fatigue',
+    'nauseous': 'nausea',
+    'nauseated': 'nausea',
+    'coughing': 'cough',
+    'dizzy': 'dizziness',
+    'anxious': 'anxiety',
+    'stomach ache': 'stomachache',
+    'stomach pain': 'stomachache',
+    'sore throats': 'sore throat',
+    'runny nose': 'congestion',
+    'stuffy nose': 'congestion',
+}
+SYMPTOM_NEGATIONS = {'no', 'not', 'without', 'never', 'none', 'nothing', 'na'}
+MIN_SYMPTOM_EFFECT_SIZE = 0.2
+# Welch's test overstates significance for symptoms seen on only a handful of days
+MIN_SYMPTOM_DAYS = 10
+METRIC_OPERATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+}
+
+
+def normalize_symptoms(text):
+    """Split a free-text symptom entry into normalized symptom terms."""
+    if not isinstance(text, str):
+        return []
+    terms = []
+    # "N/A" would otherwise be split on the slash into fragments
+    text = SYMPTOM_NOT_APPLICABLE.sub(",", text.lower())
+    for part in SYMPTOM_SEPARATORS.split(text):
+        words = [w for w in re.findall(r"[a-z]+", part) if len(w) > 1 and w not in SYMPTOM_QUALIFIERS]
+        # "no headache" or "none" reports the absence of a symptom
+        if words and words[0] in SYMPTOM_NEGATIONS:
+            continue
+        term = ' '.join(words)
+        term = SYMPTOM_SYNONYMS.get(term, term)
+        if term and term not in terms:
+            terms.append(term)
+    return terms
+
+
+class SymptomIndex:
+    """Per-user symptom vocabulary, inverted index and co-occurrence counts.
+
+    Rows are the positional rows of the user data. New rows are indexed
+    incrementally with `update`, so queries never rescan the raw text.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """Forget every indexed row."""
+        self.vocabulary = {}
+        self.terms = []
+        self.postings = []
+        self.cooccurrence = Counter()
+        self.n_rows = 0
+
+    def term_id(self, term):
+        """Return the integer ID of `term`, adding it to the vocabulary if new."""
+        if term not in self.vocabulary:
+            self.vocabulary[term] = len(self.terms)
+            self.terms.append(term)
+            self.postings.append([])
+        return self.vocabulary[term]
+
+    def add(self, row, text):
+        """Index the symptoms recorded in one row."""
+        ids = sorted(self.term_id(term) for term in normalize_symptoms(text))
+        for i, term_id in enumerate(ids):
+            self.postings[term_id].append(row)
+            for other in ids[i + 1:]:
+                self.cooccurrence[(term_id, other)] += 1
+        self.n_rows = max(self.n_rows, row + 1)
+
+    def update(self, data):
+        """Index any rows of `data` that were appended since the last update."""
+        if 'symptoms' in data.columns:
+            for row, text in enumerate(data['symptoms'].iloc[self.n_rows:], start=self.n_rows):
+                self.add(row, text)
+        self.n_rows = len(data)
+        return self
+
+    def rows(self, term):
+        """Sorted row positions where `term` was reported."""
+        term_id = self.vocabulary.get(SYMPTOM_SYNONYMS.get(term, term))
+        if term_id is None:
+            return np.empty(0, dtype=int)
+        return np.asarray(self.postings[term_id], dtype=int)
+
+    def frequencies(self):
+        """Number of entries per symptom, most frequent first."""
+        counts = pd.Series([len(p) for p in self.postings], index=self.terms, dtype=int)
+        return counts.sort_values(ascending=False)
+
+    def top_pairs(self, limit=10):
+        """Most frequent pairs of symptoms reported together."""
+        return [((self.terms[a], self.terms[b]), count)
+                for (a, b), count in self.cooccurrence.most_common(limit)]
+
+    def memory_bytes(self):
+        """Approximate memory held by the index."""
+        postings = sum(sys.getsizeof(rows) + 28 * len(rows) for rows in self.postings)
+        vocabulary = sys.getsizeof(self.vocabulary) + sum(sys.getsizeof(term) for term in self.terms)
+        return postings + vocabulary + sys.getsizeof(self.cooccurrence) + 100 * len(self.cooccurrence)
+
+    def incidence_matrix(self):
+        """Boolean (rows x symptoms) matrix built from the postings."""
+        matrix = np.zeros((self.n_rows, len(self.terms)), dtype=bool)
+        for term_id, rows in enumerate(self.postings):
+            matrix[rows, term_id] = True
+        return matrix
+
+
+def query_symptom_days(index, data, symptoms=(), conditions=()):
+    """Rows reporting all `symptoms` that also meet every metric condition.
+
+    `conditions` is a list of ``(column, op, value)`` tuples such as
+    ``('sleep_hours', '<', 6)``.
+    """
+    rows = np.arange(len(data))
+    for term in symptoms:
+        rows = np.intersect1d(rows, index.rows(term), assume_unique=True)
+        if len(rows) == 0:
+            break
+    subset = data.iloc[rows]
+    for column, op, value in conditions:
+        values = pd.to_numeric(subset[column], errors='coerce')
+        subset = subset[METRIC_OPERATORS[op](values, value).to_numpy()]
+    return subset
+
+
+def symptom_metric_associations(index, data, min_count=MIN_SYMPTOM_DAYS):
+    """Average of each metric on days with vs. without each symptom.
+
+    Only differences that pass a Welch t-test under false discovery rate
+    control and reach `MIN_SYMPTOM_EFFECT_SIZE` standard deviations are kept.
+    """
+    metrics = [col for col in METRIC_COLUMNS if col in data.columns]
+    columns = ['symptom', 'metric', 'count', 'with_symptom', 'without_symptom', 'difference',
+               'effect_size', 'p_value', 'q_value']
+    if not metrics or not index.terms:
+        return pd.DataFrame(columns=columns)
+
+    incidence = index.incidence_matrix()[:len(data)].astype(float)
+    values = data[metrics].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+    present = np.isfinite(values).astype(float)
+    values = np.nan_to_num(values)
+
+    with_n = incidence.T @ present
+    without_n = (1 - incidence).T @ present
+    with np.errstate(invalid='ignore', divide='ignore'):
+        with_mean = (incidence.T @ values) / with_n
+        without_mean = ((1 - incidence).T @ values) / without_n
+        with_var = (incidence.T @ values ** 2 - with_n * with_mean ** 2) / (with_n - 1)
+        without_var = ((1 - incidence).T @ values ** 2 - without_n * without_mean ** 2) / (without_n - 1)
+        with_se = np.maximum(with_var, 0) / with_n
+        without_se = np.maximum(without_var, 0) / without_n
+        # Welch t statistic with Welch-Satterthwaite degrees of freedom
+        t = (with_mean - without_mean) / np.sqrt(with_se + without_se)
+        df = (with_se + without_se) ** 2 / (with_se ** 2 / (with_n - 1) + without_se ** 2 / (without_n - 1))
+    p = 2 * stats.t.sf(np.abs(t), df)
+
+    symptom_idx, metric_idx = np.indices(with_mean.shape)
+    results = pd.DataFrame({
+        'symptom': np.array(index.terms)[symptom_idx.ravel()],
+        'metric': np.array(metrics)[metric_idx.ravel()],
+        'count': with_n.ravel().astype(int),
+        'with_symptom': with_mean.ravel(),
+        'without_symptom': without_mean.ravel(),
+        'p_value': p.ravel(),
+    }, columns=columns[:5] + ['p_value'])
+    results['difference'] = results['with_symptom'] - results['without_symptom']
+    # Rank by the difference in standard deviations so metrics on different scales compare
+    spread = data[metrics].apply(pd.to_numeric, errors='coerce').std().replace(0, np.nan)
+    results['effect_size'] = results['difference'] / results['metric'].map(spread)
+    results = results[(results['count'] >= min_count) & results['effect_size'].notna() & results['p_value'].notna()]
+    results['q_value'] = benjamini_hochberg(results['p_value'].to_numpy())
+    significant = (results['q_value'] <= FALSE_DISCOVERY_RATE) & \
+        (results['effect_size'].abs() >= MIN_SYMPTOM_EFFECT_SIZE)
+    results = results.loc[significant, columns]
+    return results.reindex(results['effect_size'].abs().sort_values(ascending=False).index).reset_index(drop=True)
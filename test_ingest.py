@@ -0,0 +1,92 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from ingest import (COLUMNS, changes_since, ingest_batch, load_user_data, merge_user_entries, normalize_batch,
+                    write_user_data)
+
+
+def make_batch(*entries):
+    return pd.DataFrame(list(entries))
+
+
+def test_reingesting_a_batch_is_a_no_op(tmp_path):
+    batch = make_batch({'user': 'alice', 'date': '2024-05-01', 'source': 'fitbit', 'sleep_hours': 7.5},
+                       {'user': 'alice', 'date': '2024-05-02', 'source': 'fitbit', 'sleep_hours': 6.25})
+    first = ingest_batch(batch, tmp_path)
+    stored = load_user_data('alice', tmp_path)
+    second = ingest_batch(batch, tmp_path)
+    assert (first['inserted'], first['updated']) == (2, 0)
+    assert (second['inserted'], second['updated'], second['unchanged']) == (0, 0, 2)
+    pd.testing.assert_frame_equal(load_user_data('alice', tmp_path), stored)
+
+
+def test_partial_entries_in_one_batch_are_combined(tmp_path):
+    batch = make_batch({'user': 'alice', 'date': '2024-05-01', 'source': 'fitbit', 'sleep_hours': 7.5},
+                       {'user': 'alice', 'date': '2024-05-01', 'source': 'fitbit', 'activity_minutes': 40})
+    summary = ingest_batch(batch, tmp_path)
+    stored = load_user_data('alice', tmp_path)
+    assert summary['inserted'] == 1
+    assert len(stored) == 1
+    assert (stored.loc[0, 'sleep_hours'], stored.loc[0, 'activity_minutes']) == (7.5, 40)
+
+
+def test_update_keeps_missing_fields_and_bumps_seq(tmp_path):
+    ingest_batch(make_batch({'user': 'alice', 'date': '2024-05-01', 'source': 'fitbit',
+                             'sleep_hours': 7.5, 'mood': 6}), tmp_path)
+    summary = ingest_batch(make_batch({'user': 'alice', 'date': '2024-05-01', 'source': 'fitbit',
+                                       'mood': 8}), tmp_path)
+    stored = load_user_data('alice', tmp_path)
+    assert summary['updated'] == 1
+    assert (stored.loc[0, 'sleep_hours'], stored.loc[0, 'mood'], stored.loc[0, 'seq']) == (7.5, 8, 2)
+
+
+def test_invalid_users_and_dates_are_rejected(tmp_path):
+    batch = make_batch({'user': '../alice', 'date': '2024-05-01', 'mood': 5},
+                       {'user': None, 'date': '2024-05-01', 'mood': 5},
+                       {'user': 'alice', 'date': 'yesterday', 'mood': 5},
+                       {'user': 'alice', 'date': '2024-05-01', 'mood': 5})
+    summary = ingest_batch(batch, tmp_path)
+    assert (summary['rejected'], summary['inserted']) == (3, 1)
+    assert sorted(p.name for p in tmp_path.glob('*.csv')) == ['alice.csv']
+
+
+def test_mixed_date_formats_normalize_to_local_dates():
+    batch = make_batch({'user': 'alice', 'date': '2024-05-01', 'mood': 5},
+                       {'user': 'alice', 'date': '2024-05-02T07:00:00+02:00', 'mood': 6},
+                       {'user': 'alice', 'date': '2024-05-03T23:30:00Z', 'mood': 7})
+    normalized, rejected = normalize_batch(batch)
+    assert rejected == 0
+    assert list(normalized['date']) == ['2024-05-01', '2024-05-02', '2024-05-03']
+
+
+def test_export_cursor_survives_clearing_data(tmp_path):
+    ingest_batch(make_batch({'user': 'alice', 'date': '2024-05-01', 'mood': 5},
+                            {'user': 'alice', 'date': '2024-05-02', 'mood': 6}), tmp_path)
+    cursor = int(changes_since('alice', 0, tmp_path)['seq'].max())
+    write_user_data(pd.DataFrame(columns=COLUMNS), 'alice', tmp_path)
+    ingest_batch(make_batch({'user': 'alice', 'date': '2024-05-03', 'mood': 7}), tmp_path)
+    changes = changes_since('alice', cursor, tmp_path)
+    assert list(changes['date']) == ['2024-05-03']
+    assert changes.loc[0, 'seq'] > cursor
+
+
+def test_manual_save_replaces_entry_for_same_date(tmp_path):
+    entry = {'date': '2024-05-01', 'mood': 5, 'stress': 4, 'sleep_hours': 7, 'activity_minutes': 30,
+             'symptoms': 'headache', 'source': 'manual'}
+    merge_user_entries('alice', make_batch(entry), tmp_path)
+    data, inserted, updated = merge_user_entries('alice', make_batch({**entry, 'mood': 8}), tmp_path)
+    assert (inserted, updated) == (0, 1)
+    assert len(data) == 1 and data.loc[0, 'mood'] == 8
+    assert len(load_user_data('alice', tmp_path)) == 1
+
+
+def test_concurrent_writers_keep_every_entry(tmp_path):
+    dates = pd.date_range('2024-01-01', periods=40).strftime('%Y-%m-%d')
+    entries = [make_batch({'date': date, 'mood': 5, 'stress': 4, 'sleep_hours': 7, 'activity_minutes': 30,
+                           'symptoms': '', 'source': 'manual'}) for date in dates]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda entry: merge_user_entries('alice', entry, tmp_path), entries))
+    stored = load_user_data('alice', tmp_path)
+    assert list(stored['date']) == list(dates)
+    assert sorted(stored['seq']) == list(range(1, 41))
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+from insights import describe_correlation, find_lagged_correlations
+
+
+def make_history(days, seed=0):
+    rng = np.random.default_rng(seed)
+    sleep = rng.normal(7, 1.2, days)
+    return pd.DataFrame({
+        'date': pd.date_range('2024-01-01', periods=days).strftime('%Y-%m-%d'),
+        'mood': 5 + 0.8 * np.r_[0, sleep[:-1] - 7] + rng.normal(0, 1, days),
+        'stress': rng.normal(5, 2, days),
+        'sleep_hours': sleep,
+        'activity_minutes': rng.normal(45, 20, days),
+        'symptoms': '',
+    })
+
+
+def test_constant_history_has_no_correlations():
+    data = pd.DataFrame({
+        'date': pd.date_range('2024-01-01', periods=6).strftime('%Y-%m-%d'),
+        'mood': 5, 'stress': 5, 'sleep_hours': 7, 'activity_minutes': 30, 'symptoms': '',
+    })
+    assert find_lagged_correlations(data).empty
+
+
+def test_short_history_has_no_correlations():
+    assert find_lagged_correlations(make_history(3)).empty
+
+
+def test_finds_next_day_sleep_effect():
+    results = find_lagged_correlations(make_history(400))
+    top = results.iloc[0]
+    assert (top['leader'], top['follower'], top['lag_days']) == ('sleep_hours', 'mood', 1)
+    assert top['q_value'] <= 0.05
+    assert describe_correlation(top) == "Your mood tends to be higher the day after more sleep."
+
+
+def test_noise_is_filtered():
+    data = make_history(400)
+    data['mood'] = np.random.default_rng(1).normal(5, 1, len(data))
+    assert find_lagged_correlations(data).empty
+
+
+def test_missing_days_do_not_shift_lags():
+    data = make_history(400).drop(index=range(100, 140))
+    results = find_lagged_correlations(data)
+    assert ((results['leader'] == 'sleep_hours') & (results['follower'] == 'mood')
+            & (results['lag_days'] == 1)).any()
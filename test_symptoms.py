@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+
+from symptoms import SymptomIndex, normalize_symptoms, query_symptom_days, symptom_metric_associations
+
+
+def make_history(days, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'date': pd.date_range('2024-01-01', periods=days).strftime('%Y-%m-%d'),
+        'mood': rng.integers(0, 11, days).astype(float),
+        'stress': rng.integers(0, 11, days).astype(float),
+        'sleep_hours': rng.integers(3, 10, days).astype(float),
+        'activity_minutes': rng.integers(0, 120, days).astype(float),
+        'symptoms': rng.choice(['headache', 'nausea', 'tired', '', '', ''], days),
+    })
+
+
+def test_normalize_symptoms():
+    assert normalize_symptoms("Mild headache, tired & runny nose") == ['headache', 'fatigue', 'congestion']
+    assert normalize_symptoms("Headaches; headache") == ['headache']
+
+
+def test_absent_symptoms_are_not_terms():
+    assert normalize_symptoms("N/A") == []
+    assert normalize_symptoms("n/a, cough") == ['cough']
+    assert normalize_symptoms("no headache, nausea") == ['nausea']
+    assert normalize_symptoms("none") == []
+    assert normalize_symptoms(np.nan) == []
+
+
+def test_single_letters_are_not_terms():
+    assert normalize_symptoms("a, b / c") == []
+    assert normalize_symptoms("x cough") == ['cough']
+
+
+def test_index_updates_incrementally():
+    data = pd.DataFrame({'symptoms': ['headache, nausea', '', 'headache']})
+    index = SymptomIndex().update(data.iloc[:2])
+    index.update(data)
+    assert index.frequencies().to_dict() == {'headache': 2, 'nausea': 1}
+    assert index.top_pairs() == [(('headache', 'nausea'), 1)]
+    assert list(index.rows('headaches')) == [0, 2]
+
+
+def test_query_symptom_days():
+    data = make_history(30)
+    index = SymptomIndex().update(data)
+    days = query_symptom_days(index, data, ['headache'], [('sleep_hours', '<', 6)])
+    expected = data[(data['symptoms'] == 'headache') & (data['sleep_hours'] < 6)]
+    assert days.index.equals(expected.index)
+
+
+def test_single_symptom_entry_has_no_associations():
+    data = make_history(1)
+    data['symptoms'] = 'headache'
+    assert symptom_metric_associations(SymptomIndex().update(data), data).empty
+
+
+def test_noise_is_not_reported():
+    hits = 0
+    for seed in range(40):
+        data = make_history(30, seed)
+        hits += len(symptom_metric_associations(SymptomIndex().update(data), data)) > 0
+    assert hits <= 4
+
+
+def test_finds_symptom_effect():
+    data = make_history(120)
+    data.loc[data['symptoms'] == 'headache', 'mood'] -= 3
+    results = symptom_metric_associations(SymptomIndex().update(data), data)
+    top = results.iloc[0]
+    assert (top['symptom'], top['metric']) == ('headache', 'mood')
+    assert top['difference'] < 0
+    assert top['q_value'] <= 0.05